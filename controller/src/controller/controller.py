@@ -26,7 +26,10 @@ class Controller:
         self._water_heater_controller = WaterHeaterController()
 
     def get_control_actions(self, devices_states: Dict[str, Any]) -> Dict[str, Any]:
-        configurations = utils.retrieve_device_configuration()
+        # Same current time for every device during this control loop
+        now = utils.get_local_now()
+
+        configurations = utils.retrieve_device_configuration(now)
 
         building_id = str(os.getenv("BUILDING_ID"))
 
@@ -36,11 +39,12 @@ class Controller:
             logger.info("Controller is in OFF mode, skipping control actions")
             return {}
 
-        gdp_event = utils.retrieve_gdp_event()
+        gdp_event = utils.retrieve_gdp_event(now)
         if gdp_event:
             logger.info("GDP event detected, adjusting control strategy accordingly")
         else:
             logger.info("No GDP event detected, proceeding with normal control strategy")
+        gdp_event_phase = utils.get_peak_event_phase(gdp_event, now)
 
         control_actions: Dict[str, Any] = {}
 
@@ -48,34 +52,41 @@ class Controller:
             device_type = configuration.get("device_type")
 
             if device_type == DeviceType.HUB:
-                logger.debug(f"No control actions required for device of type hub: {device_id}")
+                logger.debug("No control actions required for device of type hub: %s", device_id)
             elif (
                 device_type == DeviceType.ZONE
                 or device_type == DeviceType.THERMOSTAT
                 or device_type == DeviceType.HEAT_PUMP
             ):
-                logger.debug(f"Processing control actions for zone or climate device: {device_id}")
+                logger.debug("Processing control actions for zone or climate device: %s", device_id)
                 control_actions.update(
                     self._climate_controller.get_control_actions(
-                        device_id, configuration, configurations, devices_states, control_mode, gdp_event
+                        device_id,
+                        configuration,
+                        configurations,
+                        devices_states,
+                        control_mode,
+                        gdp_event,
+                        gdp_event_phase,
+                        now,
                     )
                 )
             elif device_type == DeviceType.BATTERY:
-                logger.debug(f"Processing control actions for battery device: {device_id}")
+                logger.debug("Processing control actions for battery device: %s", device_id)
                 control_actions.update(
                     self._battery_controller.get_control_actions(
                         device_id, configuration, configurations, devices_states, gdp_event
                     )
                 )
             elif device_type == DeviceType.ELECTRIC_VEHICLE:
-                logger.debug(f"Processing control actions for electric vehicle device: {device_id}")
+                logger.debug("Processing control actions for electric vehicle device: %s", device_id)
                 control_actions.update(
                     self._electric_vehicle_controller.get_control_actions(
                         device_id, configuration, configurations, devices_states, gdp_event
                     )
                 )
             elif device_type == DeviceType.WATER_HEATER:
-                logger.debug(f"Processing control actions for water heater device: {device_id}")
+                logger.debug("Processing control actions for water heater device: %s", device_id)
                 control_actions.update(
                     self._water_heater_controller.get_control_actions(
                         device_id, configuration, configurations, devices_states, gdp_event
@@ -83,7 +94,7 @@ class Controller:
                 )
 
             else:
-                logger.info(f"Ignoring control actions for device: {device_id}")
+                logger.info("Ignoring control actions for device: %s", device_id)
 
         return control_actions
 
@@ -91,5 +102,5 @@ class Controller:
         try:
             return utils.ControlMode(control_mode_str)
         except ValueError:
-            logger.warning(f"Invalid control mode '{control_mode_str}' in configuration, defaulting to OFF")
+            logger.warning("Invalid control mode '%s' in configuration, defaulting to OFF", control_mode_str)
             return utils.ControlMode.OFF
@@ -17,6 +17,6 @@ class BatteryController:
         devices_states: Dict[str, Any],
         gdp_event: PeakEvent | None,
     ) -> Dict[str, Any]:
-        logger.info(f"Getting control actions for battery device {device_id} *** NOT IMPLEMENTED YET ***")
+        logger.info("Getting control actions for battery device %s *** NOT IMPLEMENTED YET ***", device_id)
         control_actions: Dict[str, Any] = {}
         return control_actions
@@ -1,27 +1,54 @@
+import bisect
 import logging
 import math
 import os
+import statistics
 
-from datetime import datetime, time, timedelta
-from typing import Any, Dict, Tuple
-
-import numpy as np
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Tuple
 
 from sqlalchemy import Engine, text
 
 from controller.utils import utils
 from controller.utils.device_type import DeviceType
-from controller.utils.peak_events import PeakEvent
+from controller.utils.peak_events import (
+    PEAK_EVENT_PRECONDITIONING_DURATION,
+    PEAK_EVENT_RECOVERY_DURATION,
+    PeakEvent,
+)
 
 
 logger = logging.getLogger(__name__)
 
+# Entrée de cédule applicable: (jours de recul, minutes depuis minuit, température)
+ScheduleEntry = Tuple[int, int, float]
+
+# Initial thermostat adjustment in heating, by zone state and sign of the indoor temperature trend (0 when unknown)
+THERMOSTAT_TREND_ADJUSTMENTS: Dict[Tuple[str, int], float] = {
+    ("cool", -1): +1.2,  # Cool zone getting colder
+    ("cool", 1): +0.3,
+    ("cool", 0): +0.6,
+    ("hot", 1): -2.0,  # Hot zone getting warmer
+    ("hot", -1): -0.5,
+    ("hot", 0): -1.0,
+    ("neutral", 1): -0.5,
+    ("neutral", -1): +0.5,
+    ("neutral", 0): 0.0,
+}
+
 
 class ClimateController:
     _db_engine: Engine
+    _compiled_schedules: Dict[
+        str, Tuple[Dict[str, Any], Dict[int, List[Tuple[int, float]]], List[List[ScheduleEntry | None]]]
+    ]
+    # (configurations the index was built from, devices by linked zone id)
+    _zone_devices_index: Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]] | None
 
     def __init__(self, db_engine: Engine) -> None:
         self._db_engine = db_engine
+        self._compiled_schedules = {}
+        self._zone_devices_index = None
 
     def get_control_actions(
         self,
@@ -31,26 +58,50 @@ class ClimateController:
         devices_states: Dict[str, Any],
         control_mode: utils.ControlMode,
         peak_event: PeakEvent | None,
+        peak_event_phase: utils.PeakEventPhase,
+        now: datetime,
     ) -> Dict[str, Any]:
 
         device_type = device_configuration.get("device_type")
 
         if device_type == DeviceType.ZONE:
             return self._get_control_actions_for_zone(
-                device_id, device_configuration, all_devices_configurations, devices_states, control_mode, peak_event
+                device_id,
+                device_configuration,
+                all_devices_configurations,
+                devices_states,
+                control_mode,
+                now,
+                peak_event,
+                peak_event_phase,
             )
 
         if device_type == DeviceType.HEAT_PUMP:
             return self._get_control_actions_for_heat_pump(
-                device_id, device_configuration, all_devices_configurations, devices_states, control_mode, peak_event
+                device_id,
+                device_configuration,
+                all_devices_configurations,
+                devices_states,
+                control_mode,
+                now,
+                peak_event,
+                peak_event_phase,
             )
 
         if device_type == DeviceType.THERMOSTAT:
             return self._get_control_actions_for_thermostat(
-                device_id, device_configuration, all_devices_configurations, devices_states, peak_event
+                device_id,
+                device_configuration,
+                all_devices_configurations,
+                devices_states,
+                now,
+                peak_event,
+                peak_event_phase,
             )
 
-        logger.error(f"Unsupported device type for device {device_id}, device type: {device_type}. No control actions.")
+        logger.error(
+            "Unsupported device type for device %s, device type: %s. No control actions.", device_id, device_type
+        )
         return {}
 
     def _get_control_actions_for_zone(
@@ -60,7 +111,9 @@ class ClimateController:
         all_devices_configurations: Dict[str, Any],
         devices_states: Dict[str, Any],
         control_mode: utils.ControlMode,
+        now: datetime,
         peak_event: PeakEvent | None = None,
+        peak_event_phase: utils.PeakEventPhase = utils.PeakEventPhase.NONE,
     ) -> Dict[str, Any]:
         control_actions: Dict[str, Any] = {}
 
@@ -68,10 +121,12 @@ class ClimateController:
             zone_configuration.get("disabled_until", {}).get("value", "1970-01-01T00:00:00Z")
         )
 
-        if disabled_until > datetime.now().astimezone():
+        if disabled_until > now:
             logger.info(
-                f"Zone {zone_id} is disabled until {disabled_until}, skipping control actions for this zone, linked "
-                f"devices will be controlled individually"
+                "Zone %s is disabled until %s, skipping control actions for this zone, linked devices will be "
+                "controlled individually",
+                zone_id,
+                disabled_until,
             )
 
             return control_actions
@@ -82,23 +137,55 @@ class ClimateController:
         if outside_temperature is None:
             raise ValueError("Outside temperature is None, cannot compute heat pump COP.")
 
-        target_temperature = self._get_target_temperature(zone_id, zone_configuration, devices_states, peak_event)
+        target_temperature = self._get_target_temperature(
+            zone_id, zone_configuration, devices_states, now, peak_event, peak_event_phase
+        )
 
         heat_pump_cop = utils.get_heat_pump_cop(control_mode, outside_temperature)
 
         environment_sensor_id = str(os.getenv("ENVIRONMENT_SENSOR_ID"))
         indoor_temperature = self._get_indoor_temperature(environment_sensor_id, devices_states)
 
-        logger.debug(f"Zone {zone_id} - Inside temp.: {indoor_temperature} C, Target temp.: {target_temperature} C")
+        logger.debug(
+            "Zone %s - Inside temp.: %s C, Target temp.: %s C", zone_id, indoor_temperature, target_temperature
+        )
 
         # Get devices associated with the zone
         zone_devices = self._get_devices_for_zone(zone_id, all_devices_configurations)
         heat_pump_device_id = self._get_heat_pump_device_id(zone_devices)
 
+        # TODO: Get this value from configuration or compute it based on data (automatic) instead of hardcoding it here.
+        # TODO: Use a value for cooling and others for heating instead of a single value for both modes ?
+        heat_pump_calibration_offset = 2.0  # Degrees Celsius offset to account for heat pump compensation
+
+        # Set heat pump setpoint with calibration offset
         control_actions[heat_pump_device_id] = {
             "user_pref": target_temperature,
+            "state": "heat" if control_mode == utils.ControlMode.HEATING else "cool",
+            "setpoint": math.ceil(target_temperature + heat_pump_calibration_offset),
         }
 
+        # Set zone thermostats setpoint based on mode, the same for every thermostat of the zone
+        if control_mode == utils.ControlMode.HEATING:
+            thermostat_setpoint = self._get_zone_heating_thermostat_setpoint(
+                target_temperature, indoor_temperature, heat_pump_cop, environment_sensor_id
+            )
+        else:  # control_mode == utils.ControlMode.COOLING:
+            # Turn off auxiliary heating in cooling mode, use a lower setpoint to ensure to turn off heating
+            thermostat_setpoint = 5
+
+        thermostat_ids = (device_id for device_id in zone_devices if device_id != heat_pump_device_id)
+        control_actions.update(dict.fromkeys(thermostat_ids, thermostat_setpoint))
+
+        return control_actions
+
+    def _get_zone_heating_thermostat_setpoint(
+        self,
+        target_temperature: float,
+        indoor_temperature: float | None,
+        heat_pump_cop: float | None,
+        environment_sensor_id: str,
+    ) -> float:
         # Configurable parameters for control logic
         max_heat_push = 1.5  # Maximum heating push (positive value) to avoid excessive heating, to be tuned based on system response and desired comfort levels
         max_cool_push = -2.0  # Maximum cooling push (negative value) to avoid excessive cooling, to be tuned based on system response and desired comfort levels
@@ -110,108 +197,64 @@ class ClimateController:
         cop_excellent = 3.0  # Threshold above which the heat pump is considered very efficient and the control logic pushes more on the heat pump
 
         temp_tolerance = 0.3  # Degrees Celsius tolerance to avoid excessive on/off cycling
-        # TODO: Get this value from configuration or compute it based on data (automatic) instead of hardcoding it here.
-        # TODO: Use a value for cooling and others for heating instead of a single value for both modes ?
-        heat_pump_calibration_offset = 2.0  # Degrees Celsius offset to account for heat pump compensation
 
         # Get indoor temperature trend to adjust control actions dynamically and avoid excessive on/off cycling of heat pump and auxiliary heating
         temp_trend = self._get_indoor_temperature_trend(environment_sensor_id)
 
-        # Set heat pump setpoint and zone setpoints based on mode
-        if control_mode == utils.ControlMode.HEATING:
-            # Set heat pump setpoint with calibration offset
-            control_actions[heat_pump_device_id]["state"] = "heat"
-            control_actions[heat_pump_device_id]["setpoint"] = math.ceil(
-                target_temperature + heat_pump_calibration_offset
-            )
-
-            # Calculate temperature error and trend to adjust thermostat setpoints dynamically
-            temp_error = target_temperature - indoor_temperature  # + = frío
-            thermostat_adjustment = 0.0
-
-            # Proportional control adjustment based on temperature error
-            proportional_adjustment = kp * temp_error
-
-            # Thermostat adjustment logic
-            if indoor_temperature <= target_temperature - temp_tolerance:
-                # Cool zone
-                if temp_trend is not None and temp_trend < 0:
-                    thermostat_adjustment = +1.2
-                elif temp_trend is not None and temp_trend > 0:
-                    thermostat_adjustment = +0.3
-                else:
-                    thermostat_adjustment = +0.6
-                logger.debug(
-                    f"Zone is cool, temp trend: {temp_trend}, initial thermostat adjustment: {thermostat_adjustment:.2f} C"
-                )
-
-            elif indoor_temperature >= target_temperature + temp_tolerance:
-                # Hot zone
-                if temp_trend is not None and temp_trend > 0:
-                    thermostat_adjustment = -2.0
-                elif temp_trend is not None and temp_trend < 0:
-                    thermostat_adjustment = -0.5
-                else:
-                    thermostat_adjustment = -1.0
-                logger.debug(
-                    f"Zone is hot, temp trend: {temp_trend}, initial thermostat adjustment: {thermostat_adjustment:.2f} C"
-                )
+        # Calculate temperature error and trend to adjust thermostat setpoints dynamically
+        temp_error = target_temperature - indoor_temperature  # + = frío
 
-            else:
-                # Neutral zone
-                if temp_trend is not None and temp_trend > 0:
-                    thermostat_adjustment = -0.5
-                elif temp_trend is not None and temp_trend < 0:
-                    thermostat_adjustment = +0.5
-                else:
-                    thermostat_adjustment = 0.0
-                logger.debug(
-                    f"Zone is neutral, temp trend: {temp_trend}, initial thermostat adjustment: {thermostat_adjustment:.2f} C"
-                )
+        # Proportional control adjustment based on temperature error
+        proportional_adjustment = kp * temp_error
 
-            # Add proportional adjustment and modulate by heat pump COP
-            thermostat_adjustment += proportional_adjustment
-            if thermostat_adjustment > 0 and heat_pump_cop is not None:
-                if heat_pump_cop < cop_low:
-                    # Inefficient heat pump → let the resistive do the work
-                    thermostat_adjustment *= 0.4
-
-                elif heat_pump_cop < cop_good:
-                    # Average heat pump → moderate adjustment
-                    thermostat_adjustment *= 0.7
+        # Thermostat adjustment logic
+        if indoor_temperature <= target_temperature - temp_tolerance:
+            zone_state = "cool"
+        elif indoor_temperature >= target_temperature + temp_tolerance:
+            zone_state = "hot"
+        else:
+            zone_state = "neutral"
 
-                elif heat_pump_cop > cop_excellent:
-                    # Efficient heat pump → push more
-                    thermostat_adjustment *= 1.2
+        trend_sign = 0 if temp_trend is None else (temp_trend > 0) - (temp_trend < 0)
+        thermostat_adjustment = THERMOSTAT_TREND_ADJUSTMENTS[(zone_state, trend_sign)]
+        logger.debug(
+            "Zone is %s, temp trend: %s, initial thermostat adjustment: %.2f C",
+            zone_state,
+            temp_trend,
+            thermostat_adjustment,
+        )
 
-            thermostat_adjustment = max(max_cool_push, min(max_heat_push, thermostat_adjustment))
-            logger.debug(
-                f"Temperature error: {temp_error:.2f} C, Proportional adjustment: {proportional_adjustment:.2f} C, Final thermostat adjustment after COP modulation: {thermostat_adjustment:.2f} C"
-            )
+        # Add proportional adjustment and modulate by heat pump COP
+        thermostat_adjustment += proportional_adjustment
+        if thermostat_adjustment > 0 and heat_pump_cop is not None:
+            if heat_pump_cop < cop_low:
+                # Inefficient heat pump → let the resistive do the work
+                thermostat_adjustment *= 0.4
 
-            for device_id in zone_devices.keys():
-                if device_id != heat_pump_device_id:
-                    control_actions[device_id] = target_temperature + thermostat_adjustment
+            elif heat_pump_cop < cop_good:
+                # Average heat pump → moderate adjustment
+                thermostat_adjustment *= 0.7
 
-        else:  # control_mode == utils.ControlMode.COOLING:
-            # Set heat pump setpoint with calibration offset
-            control_actions[heat_pump_device_id]["state"] = "cool"
-            control_actions[heat_pump_device_id]["setpoint"] = math.ceil(
-                target_temperature + heat_pump_calibration_offset
-            )
+            elif heat_pump_cop > cop_excellent:
+                # Efficient heat pump → push more
+                thermostat_adjustment *= 1.2
 
-            # Turn off auxiliary heating in cooling mode
-            for device_id in zone_devices.keys():
-                if device_id != heat_pump_device_id:
-                    control_actions[device_id] = 5  # Use a lower setpoint to ensure to turn off heating
+        thermostat_adjustment = max(max_cool_push, min(max_heat_push, thermostat_adjustment))
+        logger.debug(
+            "Temperature error: %.2f C, Proportional adjustment: %.2f C, Final thermostat adjustment after COP "
+            "modulation: %.2f C",
+            temp_error,
+            proportional_adjustment,
+            thermostat_adjustment,
+        )
 
-        return control_actions
+        return target_temperature + thermostat_adjustment
 
     def _get_heat_pump_device_id(self, zone_devices: Dict[str, Any]) -> str:
         for device_id, device_configuration in zone_devices.items():
             if device_configuration.get("device_type") == DeviceType.HEAT_PUMP:
                 return device_id
-        logger.error(f"No heat pump device linked to zone found among devices: {zone_devices.keys()}")
+        logger.error("No heat pump device linked to zone found among devices: %s", zone_devices.keys())
         raise ValueError("No heat pump device linked to zone found")
 
     def _get_control_actions_for_heat_pump(
@@ -221,16 +264,18 @@ class ClimateController:
         all_devices_configurations: Dict[str, Any],
         devices_states: Dict[str, Any],
         control_mode: utils.ControlMode,
+        now: datetime,
         peak_event: PeakEvent | None = None,
+        peak_event_phase: utils.PeakEventPhase = utils.PeakEventPhase.NONE,
     ) -> Dict[str, Any]:
         control_actions: Dict[str, Any] = {}
 
         if self._is_linked_to_controlled_zone(heat_pump_configuration, all_devices_configurations):
-            logger.info(f"Heat pump {device_id} is linked to a controlled zone, skipping individual control actions")
+            logger.info("Heat pump %s is linked to a controlled zone, skipping individual control actions", device_id)
             return control_actions
 
         target_temperature = self._get_target_temperature(
-            device_id, heat_pump_configuration, devices_states, peak_event
+            device_id, heat_pump_configuration, devices_states, now, peak_event, peak_event_phase
         )
         current_temperature = devices_states.get(device_id, {}).get("attributes", {}).get("current_temperature")
 
@@ -241,7 +286,7 @@ class ClimateController:
         }
 
         logger.debug(
-            f"Device {device_id} - Inside temp.: {current_temperature} C, Target temp.: {target_temperature} C"
+            "Device %s - Inside temp.: %s C, Target temp.: %s C", device_id, current_temperature, target_temperature
         )
 
         return control_actions
@@ -252,31 +297,37 @@ class ClimateController:
         thermostat_configuration: Dict[str, Any],
         all_devices_configurations: Dict[str, Any],
         devices_states: Dict[str, Any],
+        now: datetime,
         peak_event: PeakEvent | None = None,
+        peak_event_phase: utils.PeakEventPhase = utils.PeakEventPhase.NONE,
     ) -> Dict[str, Any]:
         control_actions: Dict[str, Any] = {}
 
         if self._is_linked_to_controlled_zone(thermostat_configuration, all_devices_configurations):
-            logger.info(f"Thermostat {device_id} is linked to a controlled zone, skipping individual control actions")
+            logger.info("Thermostat %s is linked to a controlled zone, skipping individual control actions", device_id)
             return control_actions
 
         target_temperature = self._get_target_temperature(
-            device_id, thermostat_configuration, devices_states, peak_event
+            device_id, thermostat_configuration, devices_states, now, peak_event, peak_event_phase
         )
         current_temperature = devices_states.get(device_id, {}).get("attributes", {}).get("current_temperature")
         control_actions[device_id] = target_temperature  # Apply target temperature directly as setpoint
         logger.debug(
-            f"Device {device_id} - Inside temp.: {current_temperature} C, Target temp.: {target_temperature} C"
+            "Device %s - Inside temp.: %s C, Target temp.: %s C", device_id, current_temperature, target_temperature
         )
 
         return control_actions
 
     def _get_devices_for_zone(self, zone_entity_id: str, all_devices_configurations: Dict[str, Any]) -> Dict[str, Any]:
-        devices_for_zone: Dict[str, Any] = {}
-        for device_entity_id, device_configuration in all_devices_configurations.items():
-            if device_configuration.get("linked_zone_id", {}).get("value") == zone_entity_id:
-                devices_for_zone[device_entity_id] = device_configuration
-        return devices_for_zone
+        # Group the devices by linked zone once per configuration instead of scanning all the devices for each zone
+        if self._zone_devices_index is None or self._zone_devices_index[0] is not all_devices_configurations:
+            devices_by_zone: Dict[str, Dict[str, Any]] = {}
+            for device_entity_id, device_configuration in all_devices_configurations.items():
+                linked_zone_id = device_configuration.get("linked_zone_id", {}).get("value")
+                devices_by_zone.setdefault(linked_zone_id, {})[device_entity_id] = device_configuration
+            self._zone_devices_index = (all_devices_configurations, devices_by_zone)
+
+        return self._zone_devices_index[1].get(zone_entity_id, {})
 
     def _get_indoor_temperature_trend(self, environment_sensor_id: str, window_minutes: int = 15) -> float | None:
         """Calculates the indoor temperature trend based on historical data from TimescaleDB."""
@@ -296,7 +347,7 @@ class ClimateController:
 
             if len(data) < 3:
                 logger.warning(
-                    f"Not enough data points to calculate temperature trend for sensor {environment_sensor_id}"
+                    "Not enough data points to calculate temperature trend for sensor %s", environment_sensor_id
                 )
                 return None
 
@@ -306,19 +357,18 @@ class ClimateController:
             if len(clean_data) < 3:
                 return None
 
-            # Calculate trend (simple linear regression)
-            times = np.array([(row[0] - clean_data[0][0]).total_seconds() / 60.0 for row in clean_data], dtype=float)
-            temperatures = np.array([row[1] for row in clean_data], dtype=float)
+            # Calculate trend (simple linear regression), plain floats are enough for at most 100 points
+            times = [(row[0] - clean_data[0][0]).total_seconds() / 60.0 for row in clean_data]
+            temperatures = [row[1] for row in clean_data]
 
             # Linear regression to find the slope (temperature change per minute)
-            a = np.vstack([times, np.ones(len(times))]).T
-            slope, _ = np.linalg.lstsq(a, temperatures, rcond=None)[0]
+            slope = statistics.linear_regression(times, temperatures).slope
 
-            slope = float(np.clip(slope, -0.5, 0.5))
+            slope = max(-0.5, min(0.5, slope))
             return round(slope, 4)  # Temperature change per minute
 
         except Exception as e:
-            logger.error(f"Error calculating temperature trend for sensor {environment_sensor_id}: {e}")
+            logger.error("Error calculating temperature trend for sensor %s: %s", environment_sensor_id, e)
             return None
 
     def _get_indoor_temperature(self, environment_sensor_id: str, devices_states: Dict[str, Any]) -> float | None:
@@ -326,7 +376,7 @@ class ClimateController:
         temp_sensor_data = devices_states.get(environment_sensor_id)
 
         if temp_sensor_data is None:
-            logger.error(f"Environment sensor {environment_sensor_id} not found in devices states")
+            logger.error("Environment sensor %s not found in devices states", environment_sensor_id)
             return None
 
         current_temperature = temp_sensor_data.get("attributes", {}).get("current_temperature")
@@ -338,10 +388,10 @@ class ClimateController:
             try:
                 return float(state)
             except ValueError:
-                logger.error(f"State value for sensor {environment_sensor_id} is not a valid float: {state}")
+                logger.error("State value for sensor %s is not a valid float: %s", environment_sensor_id, state)
                 return None
 
-        logger.error(f"Temperature data not found for sensor {environment_sensor_id}")
+        logger.error("Temperature data not found for sensor %s", environment_sensor_id)
         return None
 
     def _is_linked_to_controlled_zone(
@@ -354,14 +404,15 @@ class ClimateController:
         linked_zone_configuration = all_devices_configurations.get(linked_zone_id)
         if not linked_zone_configuration:
             logger.warning(
-                f"Device {device_configuration} is linked to zone {linked_zone_id} which does not exist in the "
-                f"configuration"
+                "Device %s is linked to zone %s which does not exist in the configuration",
+                device_configuration,
+                linked_zone_id,
             )
             return False
 
         linked_zone_mode = linked_zone_configuration.get("mode", {}).get("value", "off")
         if linked_zone_mode == "off":
-            logger.info(f"Device {device_configuration} is linked to zone {linked_zone_id} which is in OFF mode")
+            logger.info("Device %s is linked to zone %s which is in OFF mode", device_configuration, linked_zone_id)
             return False
 
         return True
@@ -371,23 +422,24 @@ class ClimateController:
         device_id: str,
         device_configuration: Dict[str, Any],
         devices_states: Dict[str, Any],
+        now: datetime,
         gdp_event: PeakEvent | None,
+        gdp_event_phase: utils.PeakEventPhase,
     ) -> float:
 
         # Determine day type and current hour
-        now = datetime.now().astimezone()
         current_hour = now.hour
         today = now.weekday()  # Current day of the week as an integer (0=Monday, 6=Sunday)
         day_of_week = (today + 1) % 7  # Convert to Sunday=0, Monday=1, ..., Saturday=6
 
         # Get initial target temperature from schedule or manual override
         init_target_temperature, manual_override = self._get_target_from_schedule(
-            current_hour, day_of_week, devices_states, device_configuration, device_id
+            current_hour, day_of_week, now.date(), devices_states, device_configuration, device_id
         )
 
         if manual_override:
             logger.debug(
-                f"{device_id}: manual override detected with target temperature = {init_target_temperature} °C"
+                "%s: manual override detected with target temperature = %s °C", device_id, init_target_temperature
             )
             return init_target_temperature
 
@@ -396,12 +448,24 @@ class ClimateController:
             logger.debug("No GDP events today, using regular schedule")
             return init_target_temperature
 
+        # Nothing to adjust outside the event, preconditioning and recovery windows
+        if gdp_event_phase == utils.PeakEventPhase.NONE:
+            logger.debug("Outside of GDP event windows, using regular schedule")
+            return init_target_temperature
+
         # Get target temperature from schedule and apply flexibility
         target_temperature = self._get_target_from_gdp_event(
-            init_target_temperature, now, day_of_week, devices_states, device_configuration, device_id, gdp_event
+            init_target_temperature,
+            now,
+            day_of_week,
+            devices_states,
+            device_configuration,
+            device_id,
+            gdp_event,
+            gdp_event_phase,
         )
 
-        logger.debug(f"{device_id}: target temperature = {target_temperature} °C")
+        logger.debug("%s: target temperature = %s °C", device_id, target_temperature)
         return target_temperature
 
     def _get_target_from_gdp_event(
@@ -413,83 +477,66 @@ class ClimateController:
         device_configuration: Dict[str, Any],
         device_id: str,
         gdp_event: PeakEvent,
+        gdp_event_phase: utils.PeakEventPhase,
     ) -> float:
-        gdp_timestamp_dict = {
-            "start": gdp_event.datedebut,
-            "end": gdp_event.datefin,
-        }
-
-        preconditioning_timestamp_dict = {
-            "start": gdp_timestamp_dict["start"] - timedelta(hours=2),  # Two hours before event
-            "end": gdp_timestamp_dict["start"],
-        }
-
-        post_event_recovery_timestamp_dict = {
-            "start": gdp_timestamp_dict["end"],
-            "end": gdp_timestamp_dict["end"] + timedelta(hours=1),  # One hour after event
-        }
+        gdp_start, gdp_end = gdp_event.datedebut, gdp_event.datefin
+        today = now.date()
 
         # Apply flexibility adjustment if current hour is within GDP event hours
         flexibility_upward = float(device_configuration.get("flexibility_upward", {}).get("value", 0.0))
         flexibility_downward = float(device_configuration.get("flexibility_downward", {}).get("value", 0.0))
         zone_preconditioning = device_configuration.get("preconditioning", {}).get("value", "false").lower() == "true"
 
-        if now >= gdp_timestamp_dict["start"] and now < gdp_timestamp_dict["end"]:
+        if gdp_event_phase == utils.PeakEventPhase.EVENT:
             # Negative for lowering temp during event
             target_temperature = init_target_temperature - flexibility_downward
-        elif (
-            zone_preconditioning
-            and now >= preconditioning_timestamp_dict["start"]
-            and now < preconditioning_timestamp_dict["end"]
-        ):
+        elif zone_preconditioning and gdp_event_phase == utils.PeakEventPhase.PRECONDITIONING:
+            preconditioning_start = gdp_event.preconditioning_start
+
             # Calculate max target temperature during GDP event hours for preconditioning
-            start_preconditioning_hour = (preconditioning_timestamp_dict["start"]).hour
-            start_gdp_hour = (gdp_timestamp_dict["start"]).hour
-            stop_gdp_hour = (gdp_timestamp_dict["end"]).hour
+            start_preconditioning_hour = preconditioning_start.hour
+            start_gdp_hour = gdp_start.hour
+            stop_gdp_hour = gdp_end.hour
 
-            max_target_temperature_at_gdp_event, _ = (
+            # At least the event start hour, even if the event ends within the same hour
+            gdp_hours = range(start_gdp_hour, max(stop_gdp_hour, start_gdp_hour + 1))
+            max_target_temperature_at_gdp_event = max(
                 self._get_target_from_schedule(
-                    start_gdp_hour, day_of_week, devices_states, device_configuration, device_id
-                )
+                    hour, day_of_week, today, devices_states, device_configuration, device_id
+                )[0]
                 or 0.0
+                for hour in gdp_hours
             )
 
-            for hour in range(start_gdp_hour, stop_gdp_hour):
-                max_target_temperature_at_gdp_event = max(
-                    max_target_temperature_at_gdp_event,
-                    (
-                        self._get_target_from_schedule(
-                            hour, day_of_week, devices_states, device_configuration, device_id
-                        )[0]
-                    )
-                    or 0.0,
-                )
-
             # Positive for raising temp during preconditioning
             target_temperature = self._conditioning_ramping(
-                ramping_time=int(
-                    (preconditioning_timestamp_dict["end"] - preconditioning_timestamp_dict["start"]).total_seconds()
-                ),
-                elapsed_time=int((now - preconditioning_timestamp_dict["start"]).total_seconds()),
+                ramping_time=int(PEAK_EVENT_PRECONDITIONING_DURATION.total_seconds()),
+                elapsed_time=int((now - preconditioning_start).total_seconds()),
                 initial_value=(
                     self._get_target_from_schedule(
-                        start_preconditioning_hour, day_of_week, devices_states, device_configuration, device_id
+                        start_preconditioning_hour,
+                        day_of_week,
+                        today,
+                        devices_states,
+                        device_configuration,
+                        device_id,
                     )[0]
                 )
                 or 0.0,
                 target_value=flexibility_upward + max_target_temperature_at_gdp_event,
             )
-        elif now >= post_event_recovery_timestamp_dict["start"] and now < post_event_recovery_timestamp_dict["end"]:
-            stop_post_event_hour = (post_event_recovery_timestamp_dict["end"]).hour
+        elif gdp_event_phase == utils.PeakEventPhase.RECOVERY:
+            stop_post_event_hour = gdp_event.recovery_end.hour
 
             max_target_temperature_post_event_recovery, _ = self._get_target_from_schedule(
-                stop_post_event_hour, day_of_week, devices_states, device_configuration, device_id
+                stop_post_event_hour, day_of_week, today, devices_states, device_configuration, device_id
             )
 
             init_zone_temperature_after_gdp_event = (
                 self._get_target_from_schedule(
-                    (post_event_recovery_timestamp_dict["start"]).hour - 1,  # One hour before recovery
+                    gdp_end.hour - 1,  # One hour before recovery
                     day_of_week,
+                    today,
                     devices_states,
                     device_configuration,
                     device_id,
@@ -498,12 +545,8 @@ class ClimateController:
             )
 
             target_temperature = self._conditioning_ramping(
-                ramping_time=int(
-                    (
-                        post_event_recovery_timestamp_dict["end"] - post_event_recovery_timestamp_dict["start"]
-                    ).total_seconds()
-                ),
-                elapsed_time=int((now - post_event_recovery_timestamp_dict["start"]).total_seconds()),
+                ramping_time=int(PEAK_EVENT_RECOVERY_DURATION.total_seconds()),
+                elapsed_time=int((now - gdp_end).total_seconds()),
                 initial_value=init_zone_temperature_after_gdp_event,
                 target_value=max_target_temperature_post_event_recovery,  # No flexibility during recovery, just return to target
             )
@@ -516,11 +559,84 @@ class ClimateController:
         hour_str, minute_str = time_string.split(":")
         return int(hour_str) * 60 + int(minute_str)
 
+    def _get_compiled_schedule(
+        self, device_id: str, setpoint_schedule: Dict[str, Any]
+    ) -> Tuple[Dict[int, List[Tuple[int, float]]], List[List[ScheduleEntry | None]]]:
+        """
+        Retourne la cédule hebdomadaire du device sous deux formes:
+        - des listes (minutes, température) triées par heure croissante pour chaque jour;
+        - une table [jour][heure] donnant directement l'entrée applicable à chaque heure pleine de la semaine.
+
+        La cédule n'est convertie à nouveau que lorsqu'elle change dans la configuration.
+        """
+        cached_schedule = self._compiled_schedules.get(device_id)
+        if cached_schedule is not None and cached_schedule[0] == setpoint_schedule:
+            return cached_schedule[1], cached_schedule[2]
+
+        daily_schedule: Dict[int, List[Tuple[int, float]]] = {}
+        for day in range(0, 7):
+            day_schedule = setpoint_schedule.get(str(day))
+
+            if not day_schedule:
+                continue
+
+            # Convertit les entrées "HH:MM": temperature -> minutes: temperature, triées par heure croissante
+            daily_schedule[day] = sorted(
+                (
+                    (self._time_str_to_minutes(time_string), float(target_temperature_raw_value))
+                    for time_string, target_temperature_raw_value in day_schedule.items()
+                ),
+                key=lambda x: x[0],
+            )
+
+        hourly_schedule = [
+            [self._find_schedule_entry(daily_schedule, day, hour * 60) for hour in range(0, 24)] for day in range(0, 7)
+        ]
+
+        self._compiled_schedules[device_id] = (setpoint_schedule, daily_schedule, hourly_schedule)
+        return daily_schedule, hourly_schedule
+
+    def _find_schedule_entry(
+        self, daily_schedule: Dict[int, List[Tuple[int, float]]], day_of_week: int, current_minutes: int
+    ) -> ScheduleEntry | None:
+        """
+        Retourne la dernière entrée de la cédule applicable sous la forme (jours de recul, minutes, température).
+
+        La recherche se fait en reculant dans le temps (même jour puis jours précédents,
+        en bouclant sur la semaine) jusqu'à trouver la dernière entrée applicable.
+        """
+        # On recule sur un maximum de 7 jours (une semaine complète)
+        for offset in range(0, 7):
+            day = (day_of_week - offset) % 7
+            converted_schedule = daily_schedule.get(day)
+
+            if not converted_schedule:
+                continue
+
+            if offset == 0:
+                # Même jour: recherche binaire de la première entrée après l'heure actuelle
+                index = bisect.bisect_right(converted_schedule, current_minutes, key=lambda x: x[0])
+
+                if index == 0:
+                    continue
+
+                # Dernière entrée avant ou à l'heure courante
+                minutes, target_temperature = converted_schedule[index - 1]
+            else:
+                # Jour précédent dans la semaine: toute heure de ce jour est "avant" maintenant.
+                # On prend simplement la dernière entrée de ce jour.
+                minutes, target_temperature = converted_schedule[-1]
+
+            return offset, minutes, target_temperature
+
+        return None
+
     # TODO: Refactor this function to handle hours and minutes in schedule time slots (ex.: 10h30-15h45)
     def _get_target_from_schedule(
         self,
         current_hour: int,
         day_of_week: int,
+        current_date: date,
         devices_states: Dict[str, Any],
         device_configuration: Dict[str, Any],
         device_id: str,
@@ -548,87 +664,26 @@ class ClimateController:
                 device_id,
             )
         else:
-            setpoint_schedule = schedule["setpoint"]
-
-            current_minutes = current_hour * 60
-
-            # On recule sur un maximum de 7 jours (une semaine complète)
-            for offset in range(0, 7):
-                day = (day_of_week - offset) % 7
-                day_key = str(day)
-                day_schedule = setpoint_schedule.get(day_key)
-
-                if not day_schedule:
-                    continue
+            daily_schedule, hourly_schedule = self._get_compiled_schedule(device_id, schedule["setpoint"])
 
-                # Convertit les entrées "HH:MM": temperature -> minutes: temperature
-                converted_schedule: list[tuple[int, float]] = []
-                for time_string, target_temperature_raw_value in day_schedule.items():
-                    minutes = self._time_str_to_minutes(time_string)
-                    target_temperature = float(target_temperature_raw_value)
-                    converted_schedule.append((minutes, target_temperature))
-
-                if not converted_schedule:
-                    continue
-
-                # Trie par heure croissante
-                converted_schedule.sort(key=lambda x: x[0])
-
-                if offset == 0:
-                    # Même jour: on ne garde que les entrées <= heure actuelle
-                    candidates = [
-                        schedule_entry for schedule_entry in converted_schedule if schedule_entry[0] <= current_minutes
-                    ]
-
-                    if not candidates:
-                        continue
-
-                    # Dernière entrée avant ou à l'heure courante
-                    minutes, target_temperature = candidates[-1]
-
-                    # Convert schedule entry time to timestamp for comparison with manual override entries
-                    schedule_entry_timestamp = (
-                        datetime.combine(
-                            datetime.now().astimezone().date() - timedelta(days=offset),
-                            time(hour=minutes // 60, minute=minutes % 60),
-                        )
-                        .astimezone()
-                        .timestamp()
-                    )
+            if 0 <= current_hour < 24:
+                schedule_entry = hourly_schedule[day_of_week][current_hour]
+            else:
+                # Heure hors de la journée (ex.: une heure avant minuit), pas dans la table
+                schedule_entry = self._find_schedule_entry(daily_schedule, day_of_week, current_hour * 60)
 
-                    # Check for manual override after this schedule entry
-                    manual_override_temperature = self._get_manual_override_temperature(
-                        schedule_entry_timestamp, devices_states, device_configuration, device_id
-                    )
+            if schedule_entry is not None:
+                offset, minutes, target_temperature = schedule_entry
 
-                    if manual_override_temperature is not None:
-                        return manual_override_temperature, True
-
-                    return target_temperature, False
-                else:
-                    # Jour précédent dans la semaine: toute heure de ce jour est "avant" maintenant.
-                    # On prend simplement la dernière entrée de ce jour.
-                    minutes, target_temperature = converted_schedule[-1]
-
-                    # Convert schedule entry time to timestamp for comparison with manual override entries
-                    schedule_entry_timestamp = (
-                        datetime.combine(
-                            datetime.now().astimezone().date() - timedelta(days=offset),
-                            time(hour=minutes // 60, minute=minutes % 60),
-                        )
-                        .astimezone()
-                        .timestamp()
-                    )
-
-                    # Check for manual override newer than this schedule entry
-                    manual_override_temperature = self._get_manual_override_temperature(
-                        schedule_entry_timestamp, devices_states, device_configuration, device_id
-                    )
+                # Check for manual override newer than this schedule entry
+                manual_override_temperature = self._get_manual_override_temperature(
+                    current_date - timedelta(days=offset), minutes, devices_states, device_configuration, device_id
+                )
 
-                    if manual_override_temperature is not None:
-                        return manual_override_temperature, True
+                if manual_override_temperature is not None:
+                    return manual_override_temperature, True
 
-                    return target_temperature, False
+                return target_temperature, False
 
         # Aucune consigne trouvée sur la semaine ou aucune cédule trouvée pour ce device
         # Retourner le setpoint par default des parametres (qui pourrait être un default, override manuel)
@@ -644,7 +699,8 @@ class ClimateController:
 
     def _get_manual_override_temperature(
         self,
-        schedule_entry_timestamp: float,
+        schedule_entry_date: date,
+        schedule_entry_minutes: int,
         devices_states: Dict[str, Any],
         device_configuration: Dict[str, Any],
         device_id: str,
@@ -653,6 +709,14 @@ class ClimateController:
         setpoint_configuration = device_configuration.get("setpoint", {})
 
         if setpoint_configuration.get("source", {}) == "parameter":
+            # Convert schedule entry time to timestamp for comparison with the manual override, only needed here
+            schedule_entry_timestamp = utils.to_local_time(
+                datetime.combine(
+                    schedule_entry_date,
+                    time(hour=schedule_entry_minutes // 60, minute=schedule_entry_minutes % 60),
+                )
+            ).timestamp()
+
             timestamp_value = setpoint_configuration.get("timestamp", 0)
             override_timestamp = datetime.fromisoformat(timestamp_value).timestamp()
             if override_timestamp > schedule_entry_timestamp:
@@ -661,7 +725,7 @@ class ClimateController:
 
                 if override_value is not None:
                     logger.debug(
-                        f"Device {device_id}: manual override from IHD with target temperature = {override_value} °C"
+                        "Device %s: manual override from IHD with target temperature = %s °C", device_id, override_value
                     )
                     return float(override_value)
 
@@ -673,16 +737,10 @@ class ClimateController:
     def _conditioning_ramping(
         self, ramping_time: int, elapsed_time: int, initial_value: float, target_value: float
     ) -> float:
-        # Shorten ramping time by 15 minutes to reach target earlier and heat/cool more efficiently
+        # Shorten ramping time by 15 minutes to reach target earlier and heat/cool more efficiently, the ramping time
+        # is expected to be longer than 15 minutes
         ramping_time_short = ramping_time - 900
 
-        # Clamp elapsed time between 0 and ramping_time_short
-        if elapsed_time <= 0:
-            return round(initial_value, 2)
-        if elapsed_time >= ramping_time_short:
-            return round(target_value, 2)
-
-        # Linear interpolation
-        ratio = elapsed_time / ramping_time_short
-        y = initial_value + (target_value - initial_value) * ratio
-        return round(y, 2)
+        # Linear interpolation, with the ratio clamped between 0 (initial value) and 1 (target value)
+        ratio = max(0.0, min(1.0, elapsed_time / ramping_time_short))
+        return round(initial_value + (target_value - initial_value) * ratio, 2)
@@ -1,7 +1,8 @@
 import logging
 import os
 
-from typing import Any, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
 
 import numpy as np
 import pandas as pd
@@ -10,6 +11,7 @@ import requests
 from sqlalchemy import create_engine
 
 from controller.utils import utils
+from controller.utils.session import create_retrying_session
 
 
 logger = logging.getLogger(__name__)
@@ -32,75 +34,90 @@ postgres_db_engine = create_engine(db_url)
 
 HEAT_PUMP_ENTITY_ID = "climate.heat_pump"
 
+# Numeric value stored in TimescaleDB for each HVAC mode
+HVAC_MODE_VALUES = {"off": 0, "heat": 1, "cool": 2, "auto": 3, "dry": 4, "fan_only": 5, "unknown": np.nan}
+
+# Service calls of different entities are sent concurrently, stay below the session connection pool size (10)
+MAX_CONCURRENT_SERVICE_CALLS = 8
+
 
 class HomeAssistantDeviceInterface:
     _url_base: str
     _headers: Dict[str, str]
+    _session: requests.Session
+    _set_hvac_mode_url: str
+    _set_temperature_url: str
 
     def __init__(self, base_url: str, token: str) -> None:
         self._url_base = base_url
         self._headers = {"Authorization": f"Bearer {token}", "content-type": "application/json"}
+        self._set_hvac_mode_url = f"{base_url}/api/services/climate/set_hvac_mode"
+        self._set_temperature_url = f"{base_url}/api/services/climate/set_temperature"
+
+        # Keep the connection to Home Assistant open between control loops. Only idempotent requests (GET) are
+        # retried on gateway errors, service calls (POST) are not retried by default.
+        self._session = create_retrying_session(status_forcelist=(502, 503, 504))
+        self._session.headers.update(self._headers)
 
     def get_devices_states(self) -> Dict[str, Any]:
         """
         Retrieves the state of all the devices from the Home Assistant API.
         """
-        response = requests.get(f"{self._url_base}/api/states", headers=self._headers)
+        response = self._session.get(f"{self._url_base}/api/states")
         response.raise_for_status()
         response_json: List = response.json()
 
-        devices_states: Dict[str, Any] = {}
-
-        for state in response_json:
-            entity_id = state.pop("entity_id")
-            devices_states[entity_id] = state
+        # Index the states by entity id, the entity id itself is not kept in the state
+        devices_states: Dict[str, Any] = {state.pop("entity_id"): state for state in response_json}
 
         return devices_states
 
     def execute_control_actions(self, control_actions: Dict[str, Any], devices_states: Dict[str, Any]) -> None:
-        credentials = {
-            "api_url": f"{self._url_base}/api/services/climate/set_temperature",
-            "headers": self._headers,
-        }
-
         if not control_actions:
             logger.info("No control actions to execute")
             return
 
+        # First collect the service calls that actually change something, then send them. Calls of the same entity
+        # stay in order (heat pump mode before its setpoint), entities are sent concurrently.
+        service_calls: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        records: List[Dict[str, Any]] = []
+
         for entity_id, action in control_actions.items():
             # TODO: we should check the device type instead
             if entity_id == HEAT_PUMP_ENTITY_ID:
+                heat_pump_state = devices_states.get(HEAT_PUMP_ENTITY_ID, {})
+
                 # Set heat pump mode
-                if action["state"] == devices_states.get(HEAT_PUMP_ENTITY_ID, {}).get("state"):
-                    logger.info(f"No change to heat pump state requested (remains {action['state']})")
+                if action["state"] == heat_pump_state.get("state"):
+                    logger.info("No change to heat pump state requested (remains %s)", action["state"])
                 else:
-                    logger.info(f"Setting heat pump state to {action['state']}")
-                    credentials["api_url"] = f"{self._url_base}/api/services/climate/set_hvac_mode"
-                    params = {
-                        "action": {"entity_id": HEAT_PUMP_ENTITY_ID, "hvac_mode": action["state"]},
-                    }
-
-                    self._send_action(credentials, params)
+                    logger.info("Setting heat pump state to %s", action["state"])
+                    service_calls.setdefault(entity_id, []).append(
+                        (
+                            self._set_hvac_mode_url,
+                            {"entity_id": HEAT_PUMP_ENTITY_ID, "hvac_mode": action["state"]},
+                        )
+                    )
 
                 # Set heat pump temperature setpoint
                 if action["state"] == utils.ControlMode.OFF:
                     logger.info("Heat pump turned off, skipping setpoint adjustment")
                 else:
                     setpoint = action["setpoint"]
-                    if setpoint == devices_states.get(HEAT_PUMP_ENTITY_ID, {}).get("temperature"):
-                        logger.info(f"No change to heat pump setpoint requested (remains {setpoint} C)")
+                    if setpoint == heat_pump_state.get("temperature"):
+                        logger.info("No change to heat pump setpoint requested (remains %s C)", setpoint)
                     else:
-                        logger.info(f"Setting heat pump setpoint to {setpoint} C")
-                        credentials["api_url"] = f"{self._url_base}/api/services/climate/set_temperature"
-                        params = {
-                            "action": {"entity_id": HEAT_PUMP_ENTITY_ID, "temperature": setpoint},
-                        }
-
-                        self._send_action(credentials, params)
+                        logger.info("Setting heat pump setpoint to %s C", setpoint)
+                        service_calls.setdefault(entity_id, []).append(
+                            (
+                                self._set_temperature_url,
+                                {"entity_id": HEAT_PUMP_ENTITY_ID, "temperature": setpoint},
+                            )
+                        )
 
                 # Save user preference in database
-                self._save_in_database(
-                    data={
+                records.append(
+                    {
                         "metric_type": "control",
                         "device_id": HEAT_PUMP_ENTITY_ID,
                         "name": "user_pref",
@@ -110,57 +127,81 @@ class HomeAssistantDeviceInterface:
             else:
                 # Set zone temperature setpoint
                 if action == devices_states.get(entity_id, {}).get("temperature"):
-                    logger.info(f"No change to zone {entity_id} temperature requested (remains {action} C)")
+                    logger.info("No change to zone %s temperature requested (remains %s C)", entity_id, action)
                 else:
-                    logger.info(f"Setting zone {entity_id} temperature to {action} C")
-                    credentials["api_url"] = f"{self._url_base}/api/services/climate/set_temperature"
-                    params = {
-                        "action": {"entity_id": entity_id, "temperature": action},
-                    }
-                    self._send_action(credentials, params)
-
-    def _send_action(self, credentials: dict, params: dict) -> None:
-        api_url = credentials["api_url"]
-        headers = credentials["headers"]
-        action = params["action"]
-
-        response = requests.post(api_url, headers=headers, json=action)
+                    logger.info("Setting zone %s temperature to %s C", entity_id, action)
+                    service_calls.setdefault(entity_id, []).append(
+                        (
+                            self._set_temperature_url,
+                            {"entity_id": entity_id, "temperature": action},
+                        )
+                    )
+
+        try:
+            if service_calls:
+                # The workers share the same session, which is safe here: its headers and adapters are only set in
+                # __init__, the connection pool (10 connections) is larger than the number of workers and urllib3
+                # pools are thread-safe. Home Assistant does not set cookies on these calls.
+                with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_SERVICE_CALLS, len(service_calls))) as executor:
+                    futures = [
+                        executor.submit(self._send_entity_actions, entity_service_calls, records)
+                        for entity_service_calls in service_calls.values()
+                    ]
+
+                # Raise the first failure, if any, once every call has completed
+                for future in futures:
+                    future.result()
+        finally:
+            # Save everything that was applied in a single insert, even if a later service call failed
+            if records:
+                self._save_in_database(records)
+                logger.info("Control actions saved to TimescaleDB")
+
+    def _send_entity_actions(
+        self, service_calls: List[Tuple[str, Dict[str, Any]]], records: List[Dict[str, Any]]
+    ) -> None:
+        for api_url, action in service_calls:
+            self._send_action(api_url, action)
+
+            record = self._get_control_action_record(action)
+            if record is not None:
+                records.append(record)
+
+    def _send_action(self, api_url: str, action: Dict[str, Any]) -> None:
+        response = self._session.post(api_url, json=action)
         response.raise_for_status()
         logger.debug("Device %s requested to apply action %s", action["entity_id"], action)
-        self._save_control_actions(control_actions=action)
 
-    def _save_control_actions(self, control_actions: Dict[str, Any]) -> None:
+    def _get_control_action_record(self, control_actions: Dict[str, Any]) -> Dict[str, Any] | None:
         if "hvac_mode" in control_actions:
-            mapping = {"off": 0, "heat": 1, "cool": 2, "auto": 3, "dry": 4, "fan_only": 5, "unknown": np.nan}
             action_name = "hvac_mode"
-            action_value = mapping.get(control_actions.get("hvac_mode", "unknown"), np.nan)
+            action_value = HVAC_MODE_VALUES.get(control_actions.get("hvac_mode", "unknown"), np.nan)
         elif "temperature" in control_actions:
             action_name = "setpoint"
             action_value = control_actions.get("temperature", np.nan)
         else:
             logger.warning("No valid control action to save")
-            return
-
-        self._save_in_database(
-            data={
-                "metric_type": "control",
-                "device_id": control_actions.get("entity_id", "unknown"),
-                "name": action_name,
-                "value": action_value,
-            }
-        )
+            return None
 
-        logger.info("Control actions saved to TimescaleDB")
+        return {
+            "metric_type": "control",
+            "device_id": control_actions.get("entity_id", "unknown"),
+            "name": action_name,
+            "value": action_value,
+        }
 
-    def _save_in_database(self, data: Dict[str, Any]) -> None:
+    def _save_in_database(self, records: List[Dict[str, Any]]) -> None:
         data_to_save = pd.DataFrame(
-            data=[  # Single row of data
-                [data.get("metric_type", "unknown")]
-                + [data.get("device_id", "unknown")]
-                + [data.get("name", "unknown")]
-                + [data.get("value", np.nan)]
+            data=[
+                [
+                    data.get("metric_type", "unknown"),
+                    data.get("device_id", "unknown"),
+                    data.get("name", "unknown"),
+                    data.get("value", np.nan),
+                ]
+                for data in records
             ],
-            index=[pd.Timestamp.now(tz="UTC").replace(microsecond=0)],  # Single timestamp index
+            index=[pd.Timestamp.now(tz="UTC").replace(microsecond=0)] * len(records),  # Same timestamp for the loop
             columns=["metric_type", "device_id", "name", "value"],  # Column names
         )
 
@@ -174,4 +215,4 @@ class HomeAssistantDeviceInterface:
             if_exists="append",
         )
 
-        logger.debug("Data saved to TimescaleDB")
+        logger.debug("%s rows saved to TimescaleDB", len(records))
@@ -3,7 +3,6 @@ import os
 import time
 
 import requests
-import schedule
 
 from sqlalchemy import create_engine
 
@@ -62,16 +61,11 @@ def main() -> None:
         requests.post(f"{hems_api_base_url}/api/devices/{building_id}", json=metric, verify=False)
 
     try:
-        # Execute one time on start
-        _main_loop()
-
-        # Schedule the job every N seconds
-        schedule.every(120).seconds.do(_main_loop)
-
-        # Run the scheduler in a loop
+        # Execute on start, then every N seconds after the previous run has finished. Sleeping for the whole interval
+        # avoids waking up every second just to poll for pending jobs.
         while True:
-            schedule.run_pending()
-            time.sleep(1)
+            _main_loop()
+            time.sleep(120)
 
     except KeyboardInterrupt:
         logger.info("Application interrupted by the user")
@@ -2,10 +2,12 @@ import json
 import os
 
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
 
 import requests
 
+from controller.utils.session import create_retrying_session
+
 
 class ConfigurationClient(ABC):
     @abstractmethod
@@ -17,29 +19,44 @@ class ConfigurationClient(ABC):
 
 class MockConfigurationClient(ConfigurationClient):
     configuration_path: str
+    _configuration_file_version: Tuple[int, int] | None
+    _configuration: Dict[str, Any]
 
     def __init__(self, configuration_path: str):
         self.configuration_path = configuration_path
+        self._configuration_file_version = None
+        self._configuration = {}
 
     def get_configuration(self, day: int) -> Dict[str, Any]:
-        # Mock implementation returning dummy configuration data
-        with open(self.configuration_path, "r") as file_path:
-            configuration = json.load(file_path)
-            # TODO filter configuration based on the day parameter
-            return configuration
+        # Mock implementation returning dummy configuration data, only re-read when the file changes on disk. The size
+        # is checked along with the mtime, which may not change for writes within the file system timestamp resolution.
+        stat_result = os.stat(self.configuration_path)
+        file_version = (stat_result.st_mtime_ns, stat_result.st_size)
+        if file_version != self._configuration_file_version:
+            with open(self.configuration_path, "r") as file_path:
+                self._configuration = json.load(file_path)
+            self._configuration_file_version = file_version
+
+        # TODO filter configuration based on the day parameter
+        return self._configuration
 
 
 class RestConfigurationClient(ConfigurationClient):
     _hems_api_base_url: str
+    _session: requests.Session
 
     def __init__(self, hems_api_base_url: str):
         self._hems_api_base_url = hems_api_base_url
         self._building_id = os.getenv("BUILDING_ID")
 
+        # The configuration is fetched on every control loop, reuse the same connection to the HEMS API and retry
+        # transient server errors with backoff
+        self._session = create_retrying_session(status_forcelist=(500, 502, 503, 504), verify=False)
+
     def get_configuration(self, day: int) -> Dict[str, Any]:
         parameters = {"day": day}
-        response = requests.get(
-            f"{self._hems_api_base_url}/api/devices/{self._building_id}", params=parameters, verify=False
+        response = self._session.get(
+            f"{self._hems_api_base_url}/api/devices/{self._building_id}", params=parameters, timeout=10
         )
         response.raise_for_status()
         configuration_data = response.json()
@@ -2,24 +2,50 @@ import json
 import os
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, field
-from datetime import datetime
-from typing import List
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import cached_property
+from typing import Any, Dict, List, Tuple
 
 import requests
 
-from dataclasses_json import config, dataclass_json
+from controller.utils.session import create_retrying_session
+
+
+# Zones are preconditioned before a peak event and brought back to their schedule after it
+PEAK_EVENT_PRECONDITIONING_DURATION = timedelta(hours=2)
+PEAK_EVENT_RECOVERY_DURATION = timedelta(hours=1)
 
 
-@dataclass_json
 @dataclass
 class PeakEvent:
     offre: str
     plagehoraire: str
     duree: str
     secteurclient: str
-    datedebut: datetime = field(metadata=config(decoder=datetime.fromisoformat, encoder=datetime.isoformat))
-    datefin: datetime = field(metadata=config(decoder=datetime.fromisoformat, encoder=datetime.isoformat))
+    datedebut: datetime
+    datefin: datetime
+
+    # Events are kept between control loops, compute their preconditioning and recovery bounds only once
+    @cached_property
+    def preconditioning_start(self) -> datetime:
+        return self.datedebut - PEAK_EVENT_PRECONDITIONING_DURATION
+
+    @cached_property
+    def recovery_end(self) -> datetime:
+        return self.datefin + PEAK_EVENT_RECOVERY_DURATION
+
+
+def _peak_event_from_dict(event: Dict[str, Any]) -> PeakEvent:
+    # Build the event directly, without reflection over the dataclass fields
+    return PeakEvent(
+        offre=event["offre"],
+        plagehoraire=event["plagehoraire"],
+        duree=event["duree"],
+        secteurclient=event["secteurclient"],
+        datedebut=datetime.fromisoformat(event["datedebut"]),
+        datefin=datetime.fromisoformat(event["datefin"]),
+    )
 
 
 class BasePeakEventClient(ABC):
@@ -31,26 +57,40 @@ class BasePeakEventClient(ABC):
 
 class MockPeakEventClient(BasePeakEventClient):
     gdp_events_path: str
+    _peak_events_file_version: Tuple[int, int] | None
+    _peak_events: List[PeakEvent]
 
     def __init__(self, gdp_events_path: str):
         self.gdp_events_path = gdp_events_path
+        self._peak_events_file_version = None
+        self._peak_events = []
 
     def get_peak_events(self) -> List[PeakEvent]:
-        # Mock implementation returning dummy peak events
-        with open(self.gdp_events_path, "r") as file_path:
-            peak_events = json.load(file_path)
-            return [PeakEvent.from_dict(event) for event in peak_events]  # type: ignore
+        # Mock implementation returning dummy peak events, only re-read when the file (mtime or size) changes on disk
+        stat_result = os.stat(self.gdp_events_path)
+        file_version = (stat_result.st_mtime_ns, stat_result.st_size)
+        if file_version != self._peak_events_file_version:
+            with open(self.gdp_events_path, "r") as file_path:
+                peak_events = json.load(file_path)
+            self._peak_events = [_peak_event_from_dict(event) for event in peak_events]
+            self._peak_events_file_version = file_version
+
+        return self._peak_events
 
 
 class PeakEventClient(BasePeakEventClient):
     _hems_api_base_url: str
+    _session: requests.Session
 
     def __init__(self, hems_api_base_url: str):
         self._hems_api_base_url = hems_api_base_url
         self._building_id = os.getenv("BUILDING_ID")
 
+        # Reuse the same connection to the HEMS API across calls, transient server errors are retried with backoff
+        self._session = create_retrying_session(status_forcelist=(500, 502, 503, 504), verify=False)
+
     def get_peak_events(self) -> List[PeakEvent]:
-        response = requests.get(f"{self._hems_api_base_url}/api/peak-events/{self._building_id}", verify=False)
+        response = self._session.get(f"{self._hems_api_base_url}/api/peak-events/{self._building_id}", timeout=10)
         response.raise_for_status()
         peak_events_data = response.json()
-        return [PeakEvent.from_dict(event) for event in peak_events_data]  # type: ignore
+        return [_peak_event_from_dict(event) for event in peak_events_data]
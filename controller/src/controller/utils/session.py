@@ -0,0 +1,17 @@
+from typing import Tuple
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def create_retrying_session(status_forcelist: Tuple[int, ...], verify: bool = True) -> requests.Session:
+    # Connections are kept open between calls, responses with one of the given status codes are retried with an
+    # exponential backoff (only for idempotent methods, urllib3 does not retry POST requests by default)
+    session = requests.Session()
+    session.verify = verify
+    adapter = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=status_forcelist))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
@@ -1,10 +1,15 @@
+import atexit
+import bisect
+import copy
 import datetime
 import logging
 import os
+import queue
+import zoneinfo
 
 from enum import StrEnum
-from logging.handlers import TimedRotatingFileHandler
-from typing import Any, Dict
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from typing import Any, Callable, Dict, List, Tuple
 
 import numpy as np
 import requests
@@ -17,6 +22,35 @@ logger = logging.getLogger(__name__)
 CONFIG_FILE_PATH = os.getenv("CONFIG_FILE_PATH")
 LOGS_DIR = os.getenv("LOGS_DIR", "/share/controller/logs")
 
+# Peak events are published once a day, refresh them from the HEMS API at most every hour to catch late publications
+PEAK_EVENTS_REFRESH_INTERVAL = datetime.timedelta(hours=1)
+
+# Kept across control loop ticks so that clients can reuse their cached data
+_configuration_client: ConfigurationClient | None = None
+_peak_events_client: BasePeakEventClient | None = None
+# COP models fitted from the heat pump specifications, by (API base URL, heat pump model, control mode)
+_cop_models: Dict[Tuple[str, str, str], Callable[[float], float]] = {}
+# HEMS API events only, the mock client has its own cache: (client, retrieved at, today's events sorted by start
+# time, their start times)
+_peak_events_cache: Tuple[PeakEventClient, datetime.datetime, List[PeakEvent], List[datetime.datetime]] | None
+_peak_events_cache = None
+
+
+def _get_local_timezone() -> datetime.tzinfo | None:
+    # Resolve the local time zone once from the TZ set on the add-on (ex.: America/Montreal)
+    timezone_name = os.getenv("TZ")
+    if not timezone_name:
+        return None
+
+    try:
+        return zoneinfo.ZoneInfo(timezone_name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        logger.warning("Unknown time zone '%s', falling back to the system local time", timezone_name)
+        return None
+
+
+LOCAL_TIMEZONE = _get_local_timezone()
+
 
 class ControlMode(StrEnum):
     HEATING = "heating"
@@ -24,6 +58,35 @@ class ControlMode(StrEnum):
     OFF = "off"
 
 
+class PeakEventPhase(StrEnum):
+    NONE = "none"
+    PRECONDITIONING = "preconditioning"
+    EVENT = "event"
+    RECOVERY = "recovery"
+
+
+def get_local_now() -> datetime.datetime:
+    if LOCAL_TIMEZONE is None:
+        return datetime.datetime.now().astimezone()
+    return datetime.datetime.now(LOCAL_TIMEZONE)
+
+
+def to_local_time(naive_datetime: datetime.datetime) -> datetime.datetime:
+    if LOCAL_TIMEZONE is None:
+        return naive_datetime.astimezone()
+    return naive_datetime.replace(tzinfo=LOCAL_TIMEZONE)
+
+
+class _LogQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the message arguments when enqueuing. The exception is kept on the record, so that the handlers
+        # of the listener format its traceback after the whole message line, as they would without the queue.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
 def setup_logging(filename: str):
     if not os.path.exists(LOGS_DIR):
         os.makedirs(LOGS_DIR)
@@ -40,20 +103,59 @@ def setup_logging(filename: str):
     formatter = logging.Formatter("%(asctime)s [%(levelname)5s] %(message)s (%(filename)s:%(lineno)s)")
     file_handler.setFormatter(formatter)
 
+    # Keep the default console format
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    # Write the log records from a background thread, logging calls only enqueue the records
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_listener = QueueListener(
+        log_queue,
+        file_handler,  # Log to file with rotation
+        stream_handler,  # Optionally log to console
+    )
+    queue_listener.start()
+    atexit.register(queue_listener.stop)  # Flush the remaining records on exit
+
+    queue_handler = _LogQueueHandler(log_queue)
+
+    # The formats above only use the file name and line number, skip collecting thread and process information
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
     # Configure the root logger
     logger_level = os.getenv("LOGLEVEL", "DEBUG").upper()
     logging.basicConfig(
         level=logger_level,
-        handlers=[
-            file_handler,  # Log to file with rotation
-            logging.StreamHandler(),  # Optionally log to console
-        ],
+        handlers=[queue_handler],
     )
 
 
 def get_heat_pump_cop(control_mode: ControlMode, outside_temperature: float) -> float:
     hems_api_base_url = os.getenv("HEMS_API_BASE_URL", "http://hems-api.hydroquebec.lab:8500")
     heat_pump_model = os.getenv("HEAT_PUMP_MODEL", "DLCERBH18AAK")
+
+    # The specifications of a heat pump model do not change, fetch them and fit the model only once per mode
+    cop_model_key = (hems_api_base_url, heat_pump_model, control_mode)
+    cop_model = _cop_models.get(cop_model_key)
+    if cop_model is None:
+        # Only kept once the fit succeeded, an invalid specification is fetched again on the next call
+        cop_model = _create_heat_pump_cop_model(hems_api_base_url, heat_pump_model, control_mode)
+        _cop_models[cop_model_key] = cop_model
+
+    cop = cop_model(outside_temperature)
+
+    logger.info(
+        "Outside temperature: %s C, Heat Pump COP: %.2f, Heat Pump mode: %s", outside_temperature, cop, control_mode
+    )
+
+    return cop
+
+
+def _create_heat_pump_cop_model(
+    hems_api_base_url: str, heat_pump_model: str, control_mode: ControlMode
+) -> Callable[[float], float]:
     response = requests.get(f"{hems_api_base_url}/api/devices/specifications/{heat_pump_model}", verify=False)
     response.raise_for_status()
     heat_pump_specifications = response.json()
@@ -65,79 +167,154 @@ def get_heat_pump_cop(control_mode: ControlMode, outside_temperature: float) ->
     else:
         raise ValueError(f"Invalid control mode '{control_mode}' for COP model creation")
 
-    # Create regression model using heating COP data points
-    outside_temperatures_list = [data["outdoor_dry_bulb_C"] for data in cop_points.values()]
-    cop_values_list = [data["max"] for data in cop_points.values()]
-    cop_model = np.poly1d(np.polyfit(outside_temperatures_list, cop_values_list, 2))
-    cop = cop_model(outside_temperature)
-
-    logger.info(
-        f"Outside temperature: {outside_temperature} C, Heat Pump COP: {cop:.2f}, Heat Pump mode: {control_mode}"
-    )
+    # Create regression model using COP data points, read in a single pass as (outside temperature, COP) rows
+    cop_data = np.array(
+        [(data["outdoor_dry_bulb_C"], data["max"]) for data in cop_points.values()], dtype=np.float64
+    ).reshape(-1, 2)
+    return create_cop_model(cop_data[:, 0], cop_data[:, 1])
 
-    return cop
 
+def _get_peak_events_client() -> BasePeakEventClient:
+    global _peak_events_client
 
-def retrieve_gdp_event() -> PeakEvent | None:
     gdp_events_path = os.getenv("MOCK_GDP_EVENTS_PATH", "/share/controller/config/peak-events.json")
 
-    peak_events_client: BasePeakEventClient
-
+    # The mock file can be dropped in or removed while the controller is running
     if os.path.exists(gdp_events_path):
-        logger.debug("Using GDP events from local file: %s", gdp_events_path)
-        peak_events_client = MockPeakEventClient(gdp_events_path)
-    else:
+        if not isinstance(_peak_events_client, MockPeakEventClient):
+            logger.debug("Using GDP events from local file: %s", gdp_events_path)
+            _peak_events_client = MockPeakEventClient(gdp_events_path)
+    elif not isinstance(_peak_events_client, PeakEventClient):
         logger.debug("Using GDP events from Hydro-Quebec API")
-        peak_events_client = PeakEventClient(os.getenv("HEMS_API_BASE_URL", "http://hems-api.hydroquebec.lab:8500"))
+        _peak_events_client = PeakEventClient(os.getenv("HEMS_API_BASE_URL", "http://hems-api.hydroquebec.lab:8500"))
+
+    return _peak_events_client
+
+
+def create_cop_model(outside_temperatures: np.ndarray, cop_values: np.ndarray) -> Callable[[float], float]:
+    # Fit a second degree polynomial once, then evaluate it in Horner form with plain float operations. The columns of
+    # the Vandermonde matrix are scaled, as np.polyfit does, to keep the normal equations well conditioned.
+    if outside_temperatures.size == 0:
+        raise ValueError("No COP points to create the COP model from")
+
+    vandermonde = np.vander(outside_temperatures, 3)
+    scale = np.sqrt((vandermonde * vandermonde).sum(axis=0))
+    scale[scale == 0] = 1.0
+    vandermonde /= scale
+    if np.unique(outside_temperatures).size >= 3:
+        # Full rank, solve the 3x3 normal equations directly instead of going through an SVD
+        coefficients = np.linalg.solve(vandermonde.T @ vandermonde, vandermonde.T @ cop_values)
+    else:
+        # A mode with only two COP points is underdetermined, use the minimum norm least squares solution then
+        rcond = len(outside_temperatures) * np.finfo(np.float64).eps
+        coefficients = np.linalg.lstsq(vandermonde, cop_values, rcond=rcond)[0]
+    # Python floats, arithmetic on numpy scalars is several times slower for a single evaluation
+    c2, c1, c0 = (coefficients / scale).tolist()
+    return lambda temperature: c0 + temperature * (c1 + temperature * c2)
+
+
+def _get_today_peak_events(now: datetime.datetime) -> Tuple[List[PeakEvent], List[datetime.datetime]]:
+    # Today's events sorted by start time, along with their start times for bisect
+    global _peak_events_cache
+
+    peak_events_client = _get_peak_events_client()
 
-    peak_events = peak_events_client.get_peak_events()
+    # The mock client already re-reads its file as soon as it changes on disk, only cache the HEMS API responses
+    if not isinstance(peak_events_client, PeakEventClient):
+        return _filter_today_peak_events(peak_events_client.get_peak_events(), now)
 
+    if _peak_events_cache is not None:
+        cached_client, retrieved_at, cached_today_events, cached_start_times = _peak_events_cache
+        if (
+            cached_client is peak_events_client
+            and retrieved_at.date() == now.date()
+            and now - retrieved_at < PEAK_EVENTS_REFRESH_INTERVAL
+        ):
+            return cached_today_events, cached_start_times
+
+    today_events, start_times = _filter_today_peak_events(peak_events_client.get_peak_events(), now)
+    _peak_events_cache = (peak_events_client, now, today_events, start_times)
+
+    return today_events, start_times
+
+
+def _filter_today_peak_events(
+    peak_events: List[PeakEvent], now: datetime.datetime
+) -> Tuple[List[PeakEvent], List[datetime.datetime]]:
     logger.debug("Retrieved %s GDP events", len(peak_events))
 
-    now = datetime.datetime.now().astimezone()
     today = now.date()
+    today_events = sorted(
+        (event for event in peak_events if event.datedebut.date() == today), key=lambda e: e.datedebut
+    )
+    start_times = [event.datedebut for event in today_events]
+
+    return today_events, start_times
 
-    # Filter events for today
-    today_events = [event for event in peak_events if event.datedebut.date() == today]
+
+def retrieve_gdp_event(now: datetime.datetime) -> PeakEvent | None:
+    today_events, start_times = _get_today_peak_events(now)
 
     if not today_events:
         logger.debug("No GDP events found for today")
         return None
 
-    # Sort events by start time
-    today_events.sort(key=lambda e: e.datedebut)
+    # Find the first event starting after now, the event before it is the last one that started
+    index = bisect.bisect_right(start_times, now)
+
+    # Event is ongoing
+    if index > 0 and now <= today_events[index - 1].datefin:
+        event = today_events[index - 1]
+        logger.debug("Current GDP event: %s", event)
+        return event
 
-    # Check for ongoing or upcoming event
-    for event in today_events:
-        # Event is ongoing
-        if event.datedebut <= now <= event.datefin:
-            logger.debug("Current GDP event: %s", event)
-            return event
-        # Event is upcoming
-        elif now < event.datedebut:
-            logger.debug("Next GDP event: %s", event)
-            return event
+    # Event is upcoming
+    if index < len(today_events):
+        event = today_events[index]
+        logger.debug("Next GDP event: %s", event)
+        return event
 
     # All events are finished
     logger.debug("All GDP events for today are finished")
     return None
 
 
-def retrieve_device_configuration() -> Dict[str, Any]:
-    configuration_path = os.getenv("MOCK_CONFIGURATION_PATH")
+def get_peak_event_phase(peak_event: PeakEvent | None, now: datetime.datetime) -> PeakEventPhase:
+    # Same for every zone during a control loop, resolve it once per tick
+    if peak_event is None:
+        return PeakEventPhase.NONE
 
-    configuration_client: ConfigurationClient
+    if peak_event.datedebut <= now < peak_event.datefin:
+        return PeakEventPhase.EVENT
+    if peak_event.preconditioning_start <= now < peak_event.datedebut:
+        return PeakEventPhase.PRECONDITIONING
+    if peak_event.datefin <= now < peak_event.recovery_end:
+        return PeakEventPhase.RECOVERY
+    return PeakEventPhase.NONE
 
-    if configuration_path is not None:
-        logger.debug("Using device configuration from local file: %s", configuration_path)
-        configuration_client = MockConfigurationClient(configuration_path)
-    else:
-        logger.debug("Using device configuration from HEMS API")
-        configuration_client = RestConfigurationClient(
-            os.getenv("HEMS_API_BASE_URL", "http://hems-api.hydroquebec.lab:8500")
-        )
 
-    today = datetime.datetime.now().astimezone().weekday()  # Current day of the week as an integer (0=Monday, 6=Sunday)
+def _get_configuration_client() -> ConfigurationClient:
+    global _configuration_client
+
+    if _configuration_client is None:
+        configuration_path = os.getenv("MOCK_CONFIGURATION_PATH")
+
+        if configuration_path is not None:
+            logger.debug("Using device configuration from local file: %s", configuration_path)
+            _configuration_client = MockConfigurationClient(configuration_path)
+        else:
+            logger.debug("Using device configuration from HEMS API")
+            _configuration_client = RestConfigurationClient(
+                os.getenv("HEMS_API_BASE_URL", "http://hems-api.hydroquebec.lab:8500")
+            )
+
+    return _configuration_client
+
+
+def retrieve_device_configuration(now: datetime.datetime) -> Dict[str, Any]:
+    configuration_client = _get_configuration_client()
+
+    today = now.weekday()  # Current day of the week as an integer (0=Monday, 6=Sunday)
     day = (today + 1) % 7  # Convert to Sunday=0, Monday=1, ..., Saturday=6
     device_configuration = configuration_client.get_configuration(day)
 